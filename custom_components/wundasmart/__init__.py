@@ -11,10 +11,11 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_HOST, CONF_PASSWORD, CONF_USERNAME, CONF_SCAN_INTERVAL, Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.helpers.debounce import Debouncer
 from homeassistant.helpers.device_registry import DeviceInfo
 
 from .const import *
-from .session import get_session
+from .session import create_session, get_timeout
 from .pywundasmart import get_devices
 
 _LOGGER = logging.getLogger(__name__)
@@ -35,7 +36,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     update_interval = timedelta(seconds=entry.options.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL))
     connect_timeout = entry.options.get(CONF_CONNECT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT)
     read_timeout = entry.options.get(CONF_READ_TIMEOUT, DEFAULT_READ_TIMEOUT)
-    timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+    timeout = get_timeout(connect_timeout, read_timeout)
 
     coordinator = WundasmartDataUpdateCoordinator(
         hass, wunda_ip, wunda_user, wunda_pass, update_interval, timeout
@@ -80,54 +81,64 @@ class WundasmartDataUpdateCoordinator(DataUpdateCoordinator):
         self._wunda_ip = wunda_ip
         self._wunda_user = wunda_user
         self._wunda_pass = wunda_pass
-        self._devices = {}
         self._device_sn = None
         self._device_name = None
         self._sw_version = None
         self._hw_version = None
+        self._device_info = None
         self._timeout = timeout
-
-        super().__init__(hass, _LOGGER, name=DOMAIN, update_interval=update_interval)
+        self._session = None
+        self._devices_by_type = {}
+        self._devices_by_type_data = None
+
+        # Listeners are only called if the data has changed since the last
+        # update, which is why each update returns a new dict (see below).
+        super().__init__(hass,
+                         _LOGGER,
+                         name=DOMAIN,
+                         update_interval=update_interval,
+                         always_update=False,
+                         # Wait briefly before refreshing after a command so that
+                         # several commands made together only cause one refresh.
+                         request_refresh_debouncer=Debouncer(
+                             hass, _LOGGER, cooldown=REQUEST_REFRESH_COOLDOWN, immediate=False
+                         ))
 
     async def _async_update_data(self):
-        attempts = 0
-        max_attempts = 5
-        while attempts < max_attempts:
-            attempts += 1
-
-            async with get_session(self._wunda_ip) as session:
-                result = await get_devices(
-                    session,
-                    self._wunda_ip,
-                    self._wunda_user,
-                    self._wunda_pass,
-                    timeout=self._timeout
-                )
-
-            if result["state"]:
-                break
-
-            if attempts < max_attempts:
-                _LOGGER.warning(f"Failed to fetch state information from Wundasmart (will retry): {result=}")
-                await asyncio.sleep(1)
-        else:
+        result = await get_devices(
+            await self.get_session(),
+            self._wunda_ip,
+            self._wunda_user,
+            self._wunda_pass,
+            timeout=self._timeout,
+            retries=5
+        )
+
+        if not result["state"]:
             _LOGGER.warning(f"Failed to fetch state information from Wundasmart: {result=}")
             raise UpdateFailed()
 
+        # Merge the new state into a copy of the current data rather than
+        # updating it in place, so it can be compared with the previous data.
+        # Devices that haven't changed are reused, and if nothing has changed
+        # the current data is returned as is.
+        prev_devices = self.data or {}
+        devices = None
         for wunda_id, device in result["devices"].items():
             state = device.get("state")
-            if state is not None:
-                prev = self._devices.setdefault(wunda_id, {})
-                self._devices[wunda_id] |= device | {
-                    "state": prev.get("state", {}) | state
-                }
-
             sensor_state = device.get("sensor_state")
-            if sensor_state is not None:
-                prev = self._devices.setdefault(wunda_id, {})
-                self._devices[wunda_id] |= device | {
-                    "sensor_state": prev.get("sensor_state", {}) | sensor_state
-                }
+            if state is not None or sensor_state is not None:
+                prev = prev_devices.get(wunda_id, {})
+                merged = prev | device
+                if state is not None:
+                    merged["state"] = prev.get("state", {}) | state
+                if sensor_state is not None:
+                    merged["sensor_state"] = prev.get("sensor_state", {}) | sensor_state
+
+                if merged != prev:
+                    if devices is None:
+                        devices = dict(prev_devices)
+                    devices[wunda_id] = merged
 
             # Get the hub switch serial number if we don't have it already
             if self._device_sn is None and "device_sn" in device:
@@ -136,7 +147,37 @@ class WundasmartDataUpdateCoordinator(DataUpdateCoordinator):
                 self._sw_version = device.get("device_soft_version", "unknown")
                 self._hw_version = device.get("device_hard_version", "unknown")
 
-        return self._devices
+        return prev_devices if devices is None else devices
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the session shared by all requests to the hub switch."""
+        if self._session is None or self._session.closed:
+            self._session = create_session()
+        return self._session
+
+    async def async_shutdown(self) -> None:
+        """Shutdown the coordinator and close the shared session."""
+        await super().async_shutdown()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            # Zero-sleep to allow underlying connections to close
+            # https://docs.aiohttp.org/en/stable/client_advanced.html#graceful-shutdown
+            await asyncio.sleep(0)
+
+    def get_devices_by_type(self, device_type: str) -> dict:
+        """Return the devices of a given type, keyed by wunda id.
+
+        The devices are grouped once for each new version of the data, since
+        updates replace the data rather than changing it in place.
+        """
+        if self._devices_by_type_data is not self.data:
+            devices_by_type = {}
+            for wunda_id, device in (self.data or {}).items():
+                devices_by_type.setdefault(device.get("device_type"), {})[wunda_id] = device
+            self._devices_by_type = devices_by_type
+            self._devices_by_type_data = self.data
+        return self._devices_by_type.get(device_type, {})
 
     @property
     def device_sn(self):
@@ -147,10 +188,13 @@ class WundasmartDataUpdateCoordinator(DataUpdateCoordinator):
         if self._device_sn is None:
             return None
 
-        return DeviceInfo(
-            identifiers={(DOMAIN, self._device_sn)},
-            manufacturer="Wunda",
-            name=self._device_name or "Smart HubSwitch",
-            hw_version=self._hw_version,
-            sw_version=self._sw_version
-        )
+        # The hub switch details are only set once, so the DeviceInfo is only built once.
+        if self._device_info is None:
+            self._device_info = DeviceInfo(
+                identifiers={(DOMAIN, self._device_sn)},
+                manufacturer="Wunda",
+                name=self._device_name or "Smart HubSwitch",
+                hw_version=self._hw_version,
+                sw_version=self._sw_version
+            )
+        return self._device_info
@@ -1,7 +1,6 @@
 """Support for WundaSmart climate."""
 from __future__ import annotations
 
-import math
 import logging
 import aiohttp
 from typing import Any
@@ -28,8 +27,8 @@ from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.helpers import config_validation as cv
 
 from . import WundasmartDataUpdateCoordinator
-from .pywundasmart import send_command, set_register, get_room_id_from_device
-from .session import get_session
+from .pywundasmart import send_command, set_register, get_room_id_from_device, CommandQueue
+from .session import get_timeout
 from .const import *
 
 _LOGGER = logging.getLogger(__name__)
@@ -70,12 +69,12 @@ async def async_setup_entry(
 
     connect_timeout = entry.options.get(CONF_CONNECT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT)
     read_timeout = entry.options.get(CONF_READ_TIMEOUT, DEFAULT_READ_TIMEOUT)
-    timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+    timeout = get_timeout(connect_timeout, read_timeout)
 
     rooms = (
         (wunda_id, device) for wunda_id, device
-        in coordinator.data.items()
-        if device.get("device_type") == "ROOM" and "name" in device
+        in coordinator.get_devices_by_type("ROOM").items()
+        if "name" in device
     )
     async_add_entities((Device(
             wunda_ip,
@@ -144,6 +143,8 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], ClimateEntity):
         self._attr_hvac_mode = HVACMode.AUTO
         self._attr_preset_mode = None
         self._timeout = timeout
+        self._last_written_state = None
+        self._command_queue = CommandQueue()
 
         # Update with initial state
         self.__update_state()
@@ -156,27 +157,21 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], ClimateEntity):
     def __state(self):
         return self.__room.get("state", {})
 
-    @property
-    def __sensor_state(self):
-        return self.__room.get("sensor_state", {})
-
     @property
     def __trvs(self):
-        for device in self.coordinator.data.values():
-            if device.get("device_type") == "TRV":
-                room_id = get_room_id_from_device(device)
-                if int(room_id) == int(self._wunda_id):
-                    yield device
+        for device in self.coordinator.get_devices_by_type("TRV").values():
+            room_id = get_room_id_from_device(device)
+            if int(room_id) == int(self._wunda_id):
+                yield device
 
-    def __set_current_temperature(self):
+    def __set_current_temperature(self, sensor_state):
         """Set the current temperature from the coordinator data."""
-        sensor_state = self.__sensor_state
-        if sensor_state.get("temp") is not None:
+        if (temp := sensor_state.get("temp")) is not None:
             # If we've got a room thermostat then use the temperature from that
             try:
-                self._attr_current_temperature = float(sensor_state["temp"])
+                self._attr_current_temperature = float(temp)
             except (ValueError, TypeError):
-                _LOGGER.warning(f"Unexpected temperature value '{sensor_state['temp']}' for {self._attr_name}")
+                _LOGGER.warning(f"Unexpected temperature value '{temp}' for {self._attr_name}")
             return
 
         # Otherwise look for TRVs in this room and use the avergage temperature from those
@@ -193,26 +188,23 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], ClimateEntity):
             avg_temp = sum(trv_temps) / len(trv_temps)
             self._attr_current_temperature = avg_temp
 
-    def __set_current_humidity(self):
+    def __set_current_humidity(self, sensor_state):
         """Set the current humidity from the coordinator data."""
-        sensor_state = self.__sensor_state
-        if sensor_state.get("rh") is not None:
+        if (rh := sensor_state.get("rh")) is not None:
             try:
-                self._attr_current_humidity = float(sensor_state["rh"])
+                self._attr_current_humidity = float(rh)
             except (ValueError, TypeError):
-                _LOGGER.warning(f"Unexpected humidity value '{sensor_state['rh']}' for {self._attr_name}")
+                _LOGGER.warning(f"Unexpected humidity value '{rh}' for {self._attr_name}")
 
-    def __set_target_temperature(self):
+    def __set_target_temperature(self, state):
         """Set the set temperature from the coordinator data."""
-        state = self.__state
-        if state.get("temp") is not None:
+        if (temp := state.get("temp")) is not None:
             try:
-                self._attr_target_temperature = float(state["temp"])
+                self._attr_target_temperature = float(temp)
             except (ValueError, TypeError):
-                _LOGGER.warning(f"Unexpected set temp value '{state['temp']}' for {self._attr_name}")
+                _LOGGER.warning(f"Unexpected set temp value '{temp}' for {self._attr_name}")
 
-    def __set_preset_mode(self):
-        state = self.__state
+    def __set_preset_mode(self, state):
         try:
             set_temp = float(state.get("temp", 0.0))
         except (ValueError, TypeError):
@@ -220,21 +212,18 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], ClimateEntity):
             return
 
         for preset_mode, state_key in PRESET_MODE_STATE_KEYS.items():
-            if state.get(state_key) is not None:
+            if (t_preset := state.get(state_key)) is not None:
                 try:
-                    t_preset = float(self.__state[state_key])
-                    if t_preset == set_temp:
+                    if float(t_preset) == set_temp:
                         self._attr_preset_mode = preset_mode
                         break
                 except (ValueError, TypeError):
-                    _LOGGER.warning(f"Unexpected {state_key} value '{state[state_key]}' for {self._attr_name}")
+                    _LOGGER.warning(f"Unexpected {state_key} value '{t_preset}' for {self._attr_name}")
         else:
             self._attr_preset_mode = None
 
-    def __set_hvac_state(self):
+    def __set_hvac_state(self, state):
         """Set the hvac action and hvac mode from the coordinator data."""
-        state = self.__state
-
         temp_pre = 0
         if state.get("temp_pre") is not None:
             try:
@@ -282,39 +271,65 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], ClimateEntity):
         )
 
     def __update_state(self):
-        self.__set_current_temperature()
-        self.__set_current_humidity()
-        self.__set_target_temperature()
-        self.__set_preset_mode()
-        self.__set_hvac_state()
+        # Look up the room's state once and use it for everything below
+        room = self.__room
+        state = room.get("state", {})
+        sensor_state = room.get("sensor_state", {})
+
+        self.__set_current_temperature(sensor_state)
+        self.__set_current_humidity(sensor_state)
+        self.__set_target_temperature(state)
+        self.__set_preset_mode(state)
+        self.__set_hvac_state(state)
 
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
         self.__update_state()
-        super()._handle_coordinator_update()
+
+        # Only write the state if it's changed since it was last written
+        written_state = (
+            self.available,
+            self._attr_current_temperature,
+            self._attr_target_temperature,
+            self._attr_current_humidity,
+            self._attr_hvac_mode,
+            self._attr_hvac_action,
+            self._attr_preset_mode
+        )
+        if written_state != self._last_written_state:
+            self._last_written_state = written_state
+            super()._handle_coordinator_update()
 
     async def async_added_to_hass(self) -> None:
         """When entity is added to hass."""
         await super().async_added_to_hass()
         self._handle_coordinator_update()
 
+    async def __send_room_command(self, params: dict[str, Any]) -> None:
+        """Send a cmd=1 command for this room via the command queue."""
+        await self._command_queue.send(self.__send_command, {
+            "cmd": 1,
+            "roomid": self._wunda_id
+        } | params)
+
+    async def __send_command(self, params: dict[str, Any]) -> None:
+        session = await self.coordinator.get_session()
+        await send_command(
+            session,
+            self._wunda_ip,
+            self._wunda_user,
+            self._wunda_pass,
+            timeout=self._timeout,
+            params=params)
+
     async def async_set_temperature(self, temperature, **kwargs):
         # Set the new target temperature
-        async with get_session(self._wunda_ip) as session:
-            await send_command(
-                session,
-                self._wunda_ip,
-                self._wunda_user,
-                self._wunda_pass,
-                timeout=self._timeout,
-                params={
-                    "cmd": 1,
-                    "roomid": self._wunda_id,
-                    "temp": temperature,
-                    "locktt": 0,
-                    "time": 0
-                })
+        await self.__send_room_command({
+            "temp": temperature,
+            "locktt": 0,
+            "time": 0
+        })
 
         # Fetch the updated state
         await self.coordinator.async_request_refresh()
@@ -322,52 +337,25 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], ClimateEntity):
     async def async_set_hvac_mode(self, hvac_mode: HVACMode):
         if hvac_mode == HVACMode.AUTO:
             # Set to programmed mode
-            async with get_session(self._wunda_ip) as session:
-                await send_command(
-                    session,
-                    self._wunda_ip,
-                    self._wunda_user,
-                    self._wunda_pass,
-                    timeout=self._timeout,
-                    params={
-                        "cmd": 1,
-                        "roomid": self._wunda_id,
-                        "prog": None,
-                        "locktt": 0,
-                        "time": 0
-                    })
+            await self.__send_room_command({
+                "prog": None,
+                "locktt": 0,
+                "time": 0
+            })
         elif hvac_mode == HVACMode.HEAT:
             # Set the target temperature to the t_hi preset temp
-            async with get_session(self._wunda_ip) as session:
-                await send_command(
-                    session,
-                    self._wunda_ip,
-                    self._wunda_user,
-                    self._wunda_pass,
-                    timeout=self._timeout,
-                    params={
-                        "cmd": 1,
-                        "roomid": self._wunda_id,
-                        "temp": float(self.__state["t_hi"]),
-                        "locktt": 0,
-                        "time": 0
-                    })
+            await self.__send_room_command({
+                "temp": float(self.__state["t_hi"]),
+                "locktt": 0,
+                "time": 0
+            })
         elif hvac_mode == HVACMode.OFF:
             # Set the target temperature to zero
-            async with get_session(self._wunda_ip) as session:
-                await send_command(
-                    session,
-                    self._wunda_ip,
-                    self._wunda_user,
-                    self._wunda_pass,
-                    timeout=self._timeout,
-                    params={
-                        "cmd": 1,
-                        "roomid": self._wunda_id,
-                        "temp": 0.0,
-                        "locktt": 0,
-                        "time": 0
-                    })
+            await self.__send_room_command({
+                "temp": 0.0,
+                "locktt": 0,
+                "time": 0
+            })
         else:
             raise NotImplementedError(f"Unsupported HVAC mode {hvac_mode}")
 
@@ -382,21 +370,11 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], ClimateEntity):
 
             t_preset = float(self.__state[state_key])
 
-            async with get_session(self._wunda_ip) as session:
-                await send_command(
-                    session,
-                    self._wunda_ip,
-                    self._wunda_user,
-                    self._wunda_pass,
-                    timeout=self._timeout,
-                    params={
-                        "cmd": 1,
-                        "roomid": self._wunda_id,
-                        "temp": t_preset,
-                        "locktt": 0,
-                        "time": 0,
-                    },
-                )
+            await self.__send_room_command({
+                "temp": t_preset,
+                "locktt": 0,
+                "time": 0
+            })
 
         # Fetch the updated state
         await self.coordinator.async_request_refresh()
@@ -414,16 +392,16 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], ClimateEntity):
         preset = service_data.data["preset"]
         temperature = service_data.data["temperature"]
 
-        async with get_session(self._wunda_ip) as session:
-            await set_register(
-                session,
-                self._wunda_ip,
-                self._wunda_user,
-                self._wunda_pass,
-                timeout=self._timeout,
-                device_id=self._wunda_id,
-                register_id=PRESET_MODE_STATE_KEYS[preset],
-                value=temperature)
+        session = await self.coordinator.get_session()
+        await set_register(
+            session,
+            self._wunda_ip,
+            self._wunda_user,
+            self._wunda_pass,
+            timeout=self._timeout,
+            device_id=self._wunda_id,
+            register_id=PRESET_MODE_STATE_KEYS[preset],
+            value=temperature)
 
         # Fetch the updated state
         await self.coordinator.async_request_refresh()
@@ -14,6 +14,9 @@ DEFAULT_SCAN_INTERVAL = 300
 DEFAULT_CONNECT_TIMEOUT = 5
 DEFAULT_READ_TIMEOUT = 5
 
+# Seconds to wait before refreshing after a refresh is requested
+REQUEST_REFRESH_COOLDOWN = 2.0
+
 @dataclass
 class DeviceIdRanges:
     MIN_SENSOR_ID: int
@@ -1,19 +1,24 @@
 import xml.etree.ElementTree as ET
+from homeassistant.util.json import json_loads
 from .const import *
 import urllib.parse
 import asyncio
 import aiohttp
 import logging
+import random
 import warnings
-import json
+import functools
 import math
 
 _LOGGER = logging.getLogger(__name__)
 
 
-DEVICE_DEFS = {'device_sn', 'prod_sn', 'device_name', 'device_type', 'eth_mac', 'name', 'id', 'i'}
+DEVICE_DEFS = frozenset({'device_sn', 'prod_sn', 'device_name', 'device_type', 'eth_mac', 'name', 'id', 'i'})
 
 
+# The id ranges only depend on the hw version, which never changes for a device,
+# so cache them rather than looking them up for every device on every update.
+@functools.lru_cache(maxsize=None)
 def get_device_id_ranges(hw_version: float):
     id_ranges = DEVICE_ID_RANGES.get(int(math.floor(hw_version)))
     if id_ranges:
@@ -24,6 +29,27 @@ def get_device_id_ranges(hw_version: float):
     return DEVICE_ID_RANGES[4]
 
 
+# The same credentials are used for every request, so reuse the encoded auth
+# rather than building a new one for each request.
+@functools.lru_cache(maxsize=8)
+def _get_auth(wunda_user: str, wunda_pass: str) -> aiohttp.BasicAuth:
+    return aiohttp.BasicAuth(wunda_user, wunda_pass)
+
+
+def _get_retry_delay(retry_delay: float, attempts: int) -> float:
+    """Return how long to wait before retrying a request to the hub switch.
+
+    The delay doubles after each attempt, with some jitter added so retries
+    don't hit the hub switch in lockstep with other requests.
+    """
+    return retry_delay * (2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+def _is_retryable(status) -> bool:
+    """Return False if a request failed with an HTTP status that won't change by retrying"""
+    return not isinstance(status, int) or status == 429 or not 400 <= status < 500
+
+
 def _device_type_from_id(device_id: int, hw_version: float) -> str:
     """Infer the device type from the wunda id"""
     id_ranges = get_device_id_ranges(hw_version)
@@ -79,11 +105,12 @@ def parse_syncvalues(data: str):
     hw_version = 0
     for device_state in data.splitlines():
         raw_values = device_state.split(";")
-        device_values = {
-            k: urllib.parse.unquote(v) for k, v in (
-                x.split(":") for x in raw_values if ":" in x
-            )
-        }
+        device_values = {}
+        for raw_value in raw_values:
+            k, sep, v = raw_value.partition(":")
+            if sep:
+                # Most values aren't quoted so only unquote the ones that need it
+                device_values[k] = urllib.parse.unquote(v) if "%" in v else v
 
         # This is set once for the first item and is the hub switch serial number
         device_sn = device_sn or device_values.get("device_sn")
@@ -113,8 +140,8 @@ def parse_syncvalues(data: str):
 
         state = device.setdefault("state", {})
 
-        device.update({k: v for k, v in device_values.items() if k in DEVICE_DEFS})
-        state.update({k: v for k, v in device_values.items() if k not in DEVICE_DEFS})
+        for k, v in device_values.items():
+            (device if k in DEVICE_DEFS else state)[k] = v
 
         # Give each device a unique id based on the hub switch serial number and device id
         device["id"] = f"wunda.{device_sn}.{device_id}"
@@ -128,13 +155,34 @@ def parse_syncvalues(data: str):
     return devices
 
 
-async def get_devices(httpsession: aiohttp.ClientSession, wunda_ip, wunda_user, wunda_pass, timeout=10):
+async def get_devices(httpsession: aiohttp.ClientSession,
+                      wunda_ip,
+                      wunda_user,
+                      wunda_pass,
+                      timeout=10,
+                      retries: int = 1,
+                      retry_delay: float = 1.0):
     """ Returns a list of active devices connected to the Wundasmart controller """
     # Query the syncvalues API, which returns a list of all sensor values for all devices. Data is formatted as semicolon-separated k;v pairs
     wunda_url = f"http://{wunda_ip}/syncvalues.cgi"
+    auth = _get_auth(wunda_user, wunda_pass)
+
+    attempts = 0
+    while True:
+        attempts += 1
+        result = await _get_syncvalues(httpsession, wunda_url, auth, timeout)
+        if result["state"] or attempts >= retries or not _is_retryable(result["code"]):
+            return result
+
+        _LOGGER.warning(f"Failed to fetch state information from Wundasmart (will retry): {result=}")
+        await asyncio.sleep(_get_retry_delay(retry_delay, attempts))
+
+
+async def _get_syncvalues(httpsession: aiohttp.ClientSession, wunda_url, auth, timeout):
+    """Fetch and parse syncvalues.cgi, without retrying"""
     try:
         async with httpsession.get(wunda_url,
-                                   auth=aiohttp.BasicAuth(wunda_user, wunda_pass),
+                                   auth=auth,
                                    timeout=timeout) as resp:
             status = resp.status
             if status == 200:
@@ -159,27 +207,70 @@ async def send_command(session: aiohttp.ClientSession,
                        retry_delay: float = 0.5):
     """Send a command to the wunda smart hub controller"""
     wunda_url = f"http://{wunda_ip}/cmd.cgi"
-    params = "&".join((k if v is None else f"{k}={v}"for k, v in params.items()))
+    if any(v is None for v in params.values()):
+        # Flags without a value (eg. 'prog') can't be passed to aiohttp as a
+        # mapping, so the query string has to be built here for those.
+        params = "&".join((k if v is None else f"{k}={v}"for k, v in params.items()))
+    auth = _get_auth(wunda_user, wunda_pass)
 
     attempts = 0
     while attempts < retries:
         attempts += 1
         async with session.get(wunda_url,
-                               auth=aiohttp.BasicAuth(wunda_user, wunda_pass), 
+                               auth=auth,
                                params=params,
                                timeout=timeout) as resp:
             status = resp.status
             if status == 200:
-                return json.loads(await resp.text())
+                # Home Assistant's json_loads uses orjson, which parses bytes directly
+                return json_loads(await resp.read())
+
+        if not _is_retryable(status):
+            break
 
         if attempts < retries:
             _LOGGER.warning(f"Failed to send command to Wundasmart (will retry): {status=}")
-            await asyncio.sleep(retry_delay)
+            await asyncio.sleep(_get_retry_delay(retry_delay, attempts))
 
     _LOGGER.warning(f"Failed to send command to Wundasmart : {status=}")
     raise RuntimeError(f"Failed to send command: {params=}; {status=}")
 
 
+class CommandQueue:
+    """Sends commands one at a time, skipping any replaced by a later command.
+
+    Each command sent for a device replaces the previous one, so if several
+    commands are made while waiting for a command to be sent only the latest
+    is sent.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._pending = None
+
+    async def send(self, send_fn, params: dict) -> bool:
+        """Send a command by awaiting send_fn(params).
+
+        Returns False if the command was replaced by a later command.
+        """
+        self._pending = params
+        async with self._lock:
+            pending, self._pending = self._pending, None
+            if pending is None:
+                # Already sent while waiting for an earlier command to complete
+                return True
+
+            try:
+                await send_fn(pending)
+            except BaseException:
+                # Leave a replacing command to be sent again by the caller that made it
+                if pending is not params and self._pending is None:
+                    self._pending = pending
+                raise
+
+        return pending is params
+
+
 async def set_register(session: aiohttp.ClientSession, 
                        wunda_ip: str,
                        wunda_user: str, 
@@ -192,28 +283,33 @@ async def set_register(session: aiohttp.ClientSession,
                        retry_delay: float = 0.5):
     """Send a setregister command to the wunda smart hub controller"""
     wunda_url = f"http://{wunda_ip}/setregister.cgi?{device_id}@{register_id}={value}"
+    auth = _get_auth(wunda_user, wunda_pass)
 
     attempts = 0
     while attempts < retries:
         attempts += 1
         async with session.get(wunda_url,
-                               auth=aiohttp.BasicAuth(wunda_user, wunda_pass), 
+                               auth=auth,
                                timeout=timeout) as resp:
-            text = None
+            body = None
             status = resp.status
             if status == 200:
-                text = await resp.text()
-                root = ET.fromstring(text)
+                # ElementTree parses the raw bytes and handles the XML encoding itself
+                body = await resp.read()
+                root = ET.fromstring(body)
                 status = root.attrib.get('status')
                 if status == "ok":
                     return status
 
+        if not _is_retryable(status):
+            break
+
         if attempts < retries:
             _LOGGER.warning("Call to setregister.cgi failed with status '%(status)s'%(text)s", {
                 "status": status,
-                "text": f"\n{text}" if text is not None else ""
+                "text": f"\n{body.decode(errors='replace')}" if body is not None else ""
             })
-            await asyncio.sleep(retry_delay)
+            await asyncio.sleep(_get_retry_delay(retry_delay, attempts))
 
     _LOGGER.warning(f"Failed to set register : {status=}")
     raise RuntimeError(f"Failed to set register: {device_id=}; {register_id=}; {value=}")
@@ -1,9 +1,8 @@
 """Support for WundaSmart sensors."""
 from __future__ import annotations
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from collections import defaultdict
 from typing import Literal
-import itertools
 
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
@@ -24,7 +23,7 @@ from homeassistant.const import (
 
 from . import WundasmartDataUpdateCoordinator
 from .pywundasmart import get_room_id_from_device, get_device_id_ranges
-from .const import *
+from .const import DOMAIN
 
 
 def _number_or_none(x):
@@ -41,7 +40,7 @@ class WundaSensorDescription(SensorEntityDescription):
     device_type: Literal["ROOM"] | Literal["TRV"] | Literal["SENSOR"] | None = None
     value_fn: callable | None = None
 
-SENSORS: list[WundaSensorDescription] = [
+SENSORS: tuple[WundaSensorDescription, ...] = (
     WundaSensorDescription(
         key="t_lo",
         device_type="ROOM",
@@ -181,7 +180,7 @@ SENSORS: list[WundaSensorDescription] = [
         name="TRV Range",
         state_class=SensorStateClass.MEASUREMENT,
     )
-]
+)
 
 
 def _device_get_room(coordinator: WundasmartDataUpdateCoordinator, device):
@@ -208,12 +207,14 @@ def _trv_get_room(coordinator: WundasmartDataUpdateCoordinator, device):
         return coordinator.data.get(room_id)
 
 
-def _trv_get_sensor_name(room, trv, desc: WundaSensorDescription):
-    """Return a human readable name for a TRV device"""
-    device_id = int(trv["device_id"])
-    hw_version = float(trv["hw_version"])
-    id_ranges = get_device_id_ranges(hw_version)
-    return room["name"] + f" TRV.{device_id - id_ranges.MIN_TRV_ID} {desc.name}"
+def _get_sensor_name_prefix(room, device):
+    """Return the human readable prefix used to name a device's sensors"""
+    if device["device_type"] == "TRV":
+        device_id = int(device["device_id"])
+        hw_version = float(device["hw_version"])
+        id_ranges = get_device_id_ranges(hw_version)
+        return f"{room['name']} TRV.{device_id - id_ranges.MIN_TRV_ID} "
+    return room["name"] + " "
 
 
 def _signal_pct_to_dbm(pct):
@@ -244,53 +245,30 @@ async def async_setup_entry(
     """Set up the sensors from config entries."""
     coordinator: WundasmartDataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]
 
-    devices_by_type = defaultdict(lambda: [])
-    for wunda_id, device in coordinator.data.items():
-        device_type = device.get("device_type")
-        if device_type is not None:
-            room = _device_get_room(coordinator, device)
-            if room is not None and room.get("name") is not None:
-                devices_by_type[device_type].append((wunda_id, device, room))
-
     descriptions_by_type = defaultdict(lambda: [])
     for desc in SENSORS:
         descriptions_by_type[desc.device_type].append(desc)
 
-    sensors = itertools.chain(
-        (
-            Sensor(wunda_id,
-               room["name"] + " " + desc.name,
-               coordinator,
-               desc)
-                for wunda_id, device, room in devices_by_type["ROOM"]
-                for desc in descriptions_by_type["ROOM"]
-        ),
-
-        (
-            Sensor(wunda_id,
-               room["name"] + " " + desc.name,
-               coordinator,
-               desc)
-                for wunda_id, device, room in devices_by_type["SENSOR"]
-                for desc in descriptions_by_type["SENSOR"]
-        ),
-
-        (
-            Sensor(wunda_id,
-               _trv_get_sensor_name(room, device, desc),
-               coordinator,
-               desc)
-                for wunda_id, device, room in devices_by_type["TRV"]
-                for desc in descriptions_by_type["TRV"]
-        )
-    )
+    sensors = []
+    for device_type in ("ROOM", "SENSOR", "TRV"):
+        for wunda_id, device in coordinator.get_devices_by_type(device_type).items():
+            room = _device_get_room(coordinator, device)
+            if room is None or room.get("name") is None:
+                continue
+
+            prefix = _get_sensor_name_prefix(room, device)
+            sensors.extend(
+                Sensor(wunda_id, prefix + desc.name, coordinator, desc)
+                for desc in descriptions_by_type[device_type]
+            )
 
-    async_add_entities(sensors, update_before_add=True)
+    async_add_entities(sensors)
 
 
 class Sensor(CoordinatorEntity[WundasmartDataUpdateCoordinator], SensorEntity):
     """Sensor entity for WundaSmart sensor values."""
 
+    _attr_should_poll = False
     _attr_translation_key = DOMAIN
 
     def __init__(
@@ -310,7 +288,12 @@ class Sensor(CoordinatorEntity[WundasmartDataUpdateCoordinator], SensorEntity):
             self._attr_unique_id = f"{device_sn}.{wunda_id}.{description.key}"
         self._attr_device_info = coordinator.device_info
 
-        self.entity_description = self.__update_description_defaults(description)
+        # Descriptions are shared between all sensors of the same type,
+        # so set the registry defaults on the entity rather than the description.
+        self.entity_description = description
+        available = self.__is_available(description)
+        self._attr_entity_registry_enabled_default = available
+        self._attr_entity_registry_visible_default = available
 
         # Update with initial state
         self.__update_state()
@@ -319,33 +302,29 @@ class Sensor(CoordinatorEntity[WundasmartDataUpdateCoordinator], SensorEntity):
     def available(self):
         return self.__is_available(self.entity_description)
 
+    @property
+    def __state(self):
+        try:
+            return self.coordinator.data[self._wunda_id]["state"]
+        except KeyError:
+            return {}
+
     def __is_available(self, description: WundaSensorDescription):
         if callable(description.available):
-            device = self.coordinator.data.get(self._wunda_id, {})
-            state = device.get("state", {})
-            return description.available(state)
+            return description.available(self.__state)
         return description.available
 
-    def __update_description_defaults(self, description: WundaSensorDescription):
-        kwargs = asdict(description)
-        available = self.__is_available(description)
-        kwargs["entity_registry_enabled_default"] = available
-        kwargs["entity_registry_visible_default"] = available
-        return WundaSensorDescription(**kwargs)
-
     def __update_state(self):
-        device = self.coordinator.data.get(self._wunda_id, {})
-        state = device.get("state", {})
+        state = self.__state
 
-        if self.entity_description.value_fn is not None:
-            value = self.entity_description.value_fn(state)
+        description = self.entity_description
+        if description.value_fn is not None:
+            value = description.value_fn(state)
         else:
-            value = state.get(self.entity_description.key)
-
-        if value is None and self.entity_description.default is not None:
-            value = self.entity_description.default
+            value = state.get(description.key)
 
-        self._attr_native_value = value
+        # Only missing values fall back to the default, 0 is a valid reading
+        self._attr_native_value = description.default if value is None else value
 
     @callback
     def _handle_coordinator_update(self) -> None:
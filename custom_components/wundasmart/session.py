@@ -59,6 +59,26 @@ class TCPConnector(aiohttp.TCPConnector):
         self._factory = functools.partial(ResponseHandler, loop=self._loop)
 
 
+@functools.lru_cache(maxsize=8)
+def get_timeout(connect_timeout, read_timeout) -> aiohttp.ClientTimeout:
+    """Return the timeout to use for requests to the Wundasmart hub switch.
+
+    ClientTimeout is immutable so the same instance is reused for the same settings.
+    """
+    return aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+
+
+def create_session() -> aiohttp.ClientSession:
+    """Return a new session for making requests to the Wundasmart hub switch.
+
+    The session can be shared by all requests to the hub switch. Connections
+    are closed after every request and only one connection is allowed at a
+    time, so requests sent using the same session are made one at a time.
+    """
+    connector = TCPConnector(force_close=True, limit=1)
+    return aiohttp.ClientSession(connector=connector)
+
+
 @asynccontextmanager
 async def get_session(wunda_ip=None):
     async with _get_semaphore(wunda_ip):
@@ -1,8 +1,10 @@
 """Support for WundaSmart water heater."""
 from __future__ import annotations
 
+import asyncio
+import bisect
+import functools
 import logging
-import math
 from typing import Any
 from datetime import timedelta
 
@@ -19,18 +21,20 @@ from homeassistant.const import (
     STATE_OFF,
     UnitOfTemperature,
 )
-from homeassistant.core import HomeAssistant, ServiceCall, callback
-from homeassistant.helpers import aiohttp_client, entity_platform
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import entity_platform
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_track_point_in_utc_time
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 import homeassistant.helpers.config_validation as cv
+import homeassistant.util.dt as dt_util
 import voluptuous as vol
 import aiohttp
 import time
 
 from . import WundasmartDataUpdateCoordinator
-from .pywundasmart import send_command
-from .session import get_session
+from .pywundasmart import send_command, CommandQueue
+from .session import get_timeout
 from .const import *
 
 _LOGGER = logging.getLogger(__name__)
@@ -38,29 +42,34 @@ _LOGGER = logging.getLogger(__name__)
 SUPPORTED_FEATURES = WaterHeaterEntityFeature.ON_OFF | WaterHeaterEntityFeature.OPERATION_MODE
 
 OPERATION_AUTO = "auto"
-OPERATION_BOOST_30 = "boost_30"
-OPERATION_BOOST_60 = "boost_60"
-OPERATION_BOOST_90 = "boost_90"
-OPERATION_BOOST_120 = "boost_120"
-OPERATION_OFF_30 = "off_30"
-OPERATION_OFF_60 = "off_60"
-OPERATION_OFF_90 = "off_90"
-OPERATION_OFF_120 = "off_120"
-
-HW_BOOST_OPERATIONS = {
-    OPERATION_BOOST_30,
-    OPERATION_BOOST_60,
-    OPERATION_BOOST_90,
-    OPERATION_BOOST_120
-}
 
-HW_OFF_OPERATIONS = {
-    OPERATION_OFF_30,
-    OPERATION_OFF_60,
-    OPERATION_OFF_90,
-    OPERATION_OFF_120
+# Durations in minutes the hot water can be boosted or turned off for
+HW_OVERRIDE_DURATIONS = (30, 60, 90, 120)
+
+# Boost and off operation modes ordered by duration, generated from the
+# durations above so the names and durations can't get out of step.
+HW_BOOST_LADDER = tuple(f"boost_{minutes}" for minutes in HW_OVERRIDE_DURATIONS)
+HW_OFF_LADDER = tuple(f"off_{minutes}" for minutes in HW_OVERRIDE_DURATIONS)
+
+OPERATION_BOOST_30, OPERATION_BOOST_60, OPERATION_BOOST_90, OPERATION_BOOST_120 = HW_BOOST_LADDER
+OPERATION_OFF_30, OPERATION_OFF_60, OPERATION_OFF_90, OPERATION_OFF_120 = HW_OFF_LADDER
+
+HW_BOOST_OPERATIONS = set(HW_BOOST_LADDER)
+HW_OFF_OPERATIONS = set(HW_OFF_LADDER)
+
+# Duration in seconds of each boost and off operation mode
+HW_OPERATION_DURATIONS = {
+    operation: minutes * 60
+    for ladder in (HW_BOOST_LADDER, HW_OFF_LADDER)
+    for operation, minutes in zip(ladder, HW_OVERRIDE_DURATIONS)
 }
 
+# The ladders above are indexed using the number of minutes left on a boost or
+# off override relative to these thresholds (see __infer_operation_mode).
+HW_OVERRIDE_MINUTES_THRESHOLDS = (0,) + HW_OVERRIDE_DURATIONS[:-1]
+
+OPERATION_LIST = (STATE_ON, STATE_OFF, OPERATION_AUTO) + HW_BOOST_LADDER + HW_OFF_LADDER
+
 # Used when setting operation mode.
 # We can't simply turn the hot water on or off without also specifying a duration.
 OPERATION_MODE_ALIASES = {
@@ -68,14 +77,15 @@ OPERATION_MODE_ALIASES = {
     STATE_OFF: OPERATION_OFF_120
 }
 
+# The state reported by the hub switch after the hot water has been boosted or turned off.
+HW_BOOST_STATE = {"hw_mode_state": "1", "hw_boost_state": "1"}
+HW_OFF_STATE = {"hw_mode_state": "0", "hw_boost_state": "1"}
 
-def _split_operation(key):
-    """Return (operation prefix, duration in seconds)"""
-    if "_" in key:
-        key, duration = key.split("_", 1)
-        if duration.isdigit():
-            return key, int(duration) * 60
-    return key, 0
+
+# The hub switch only ever reports a handful of distinct values for these flags
+@functools.lru_cache(maxsize=8)
+def _to_bool(value) -> bool:
+    return bool(int(value))
 
 
 async def async_setup_entry(
@@ -89,7 +99,14 @@ async def async_setup_entry(
 
     connect_timeout = entry.options.get(CONF_CONNECT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT)
     read_timeout = entry.options.get(CONF_READ_TIMEOUT, DEFAULT_READ_TIMEOUT)
-    timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+    timeout = get_timeout(connect_timeout, read_timeout)
+
+    wunda_devices = tuple(
+        (wunda_id, device) for wunda_id, device
+        in coordinator.get_devices_by_type("wunda").items()
+        if "device_name" in device
+    )
+    _LOGGER.debug("Adding %d Wundasmart water heater(s)", len(wunda_devices))
 
     async_add_entities(
         Device(
@@ -101,7 +118,7 @@ async def async_setup_entry(
             coordinator,
             timeout
         )
-        for wunda_id, device in coordinator.data.items() if device.get("device_type") == "wunda" and "device_name" in device
+        for wunda_id, device in wunda_devices
     )
 
     platform = entity_platform.current_platform.get()
@@ -127,11 +144,7 @@ async def async_setup_entry(
 class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], WaterHeaterEntity):
     """Representation of an Wundasmart water heater."""
 
-    _attr_operation_list = [
-        STATE_ON,
-        STATE_OFF,
-        OPERATION_AUTO
-    ] + list(sorted(HW_BOOST_OPERATIONS | HW_OFF_OPERATIONS, key=_split_operation))
+    _attr_operation_list = list(OPERATION_LIST)
 
     _attr_supported_features = WaterHeaterEntityFeature.OPERATION_MODE | WaterHeaterEntityFeature.ON_OFF
     _attr_temperature_unit = UnitOfTemperature.CELSIUS
@@ -160,6 +173,9 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], WaterHeaterEnti
         self._timeout = timeout
         self._last_operation_mode = None
         self._last_operation_mode_timeout = 0
+        self._command_queue = CommandQueue()
+        self._last_written_state = None
+        self._unsub_relabel = None
 
         # Update with initial state
         self.__update_state()
@@ -173,41 +189,32 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], WaterHeaterEnti
         """Return the operation mode from the current device state."""
         try:
             # hw_mode_state is 1 if the hot water is on, 0 otherwise.
-            hw_on = bool(int(state.get("hw_mode_state", 0)))
+            hw_on = _to_bool(state.get("hw_mode_state", 0))
         except (ValueError, TypeError):
             _LOGGER.warning(f"Unexpected hw_mode_state '{state['hw_mode_state']}' for {self._attr_name}")
             hw_on = False
 
         try:
             # hw_boost_state is non-zero when a manual override/boost is active
-            hw_override = bool(int(state.get("hw_boost_state", 0)))
+            hw_override = _to_bool(state.get("hw_boost_state", 0))
         except (ValueError, TypeError):
             _LOGGER.warning(f"Unexpected hw_boost_state '{state['hw_boost_state']}' for {self._attr_name}")
             hw_override = False
 
         # If an override's been set, get operation mode based on the time left
         if hw_override:
+            ladder = None
             if hw_on and self._last_operation_mode in HW_BOOST_OPERATIONS:
-                minutes_left = (self._last_operation_mode_timeout - time.time()) // 60
-                if minutes_left > 90:
-                    return OPERATION_BOOST_120
-                elif minutes_left > 60:
-                    return OPERATION_BOOST_90
-                elif minutes_left > 30:
-                    return OPERATION_BOOST_60
-                elif minutes_left > 0:
-                    return OPERATION_BOOST_30
-
+                ladder = HW_BOOST_LADDER
             elif not hw_on and self._last_operation_mode in HW_OFF_OPERATIONS:
+                ladder = HW_OFF_LADDER
+
+            if ladder is not None:
                 minutes_left = (self._last_operation_mode_timeout - time.time()) // 60
-                if minutes_left > 90:
-                    return OPERATION_OFF_120
-                elif minutes_left > 60:
-                    return OPERATION_OFF_90
-                elif minutes_left > 30:
-                    return OPERATION_OFF_60
-                elif minutes_left > 0:
-                    return OPERATION_OFF_30
+                # -1 if there's no time left, otherwise the index into the ladder
+                index = bisect.bisect_left(HW_OVERRIDE_MINUTES_THRESHOLDS, minutes_left) - 1
+                if index >= 0:
+                    return ladder[index]
 
         # Otherwise just return the actual state as on or off
         return STATE_ON if hw_on else STATE_OFF
@@ -216,97 +223,143 @@ class Device(CoordinatorEntity[WundasmartDataUpdateCoordinator], WaterHeaterEnti
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
         self.__update_state()
-        super()._handle_coordinator_update()
+        self.__schedule_relabel()
+
+        # Only write the state if it's changed since it was last written.
+        # The operation mode is compared rather than the raw device state as
+        # it also depends on how much time is left on any boost or off override.
+        written_state = (self.available, self._attr_current_operation)
+        if written_state != self._last_written_state:
+            self._last_written_state = written_state
+            super()._handle_coordinator_update()
 
     async def async_added_to_hass(self) -> None:
         """When entity is added to hass."""
         await super().async_added_to_hass()
         self._handle_coordinator_update()
 
+    async def async_will_remove_from_hass(self) -> None:
+        """When entity will be removed from hass."""
+        self.__cancel_relabel()
+        await super().async_will_remove_from_hass()
+
+    def __schedule_relabel(self) -> None:
+        """Schedule an update for when the current boost or off mode runs down to the next one.
+
+        The boost and off modes depend on the time left rather than on the hub
+        switch data, and the coordinator only notifies listeners when the data
+        changes, so without this they would stay the same until it does.
+        """
+        self.__cancel_relabel()
+
+        operation = self._attr_current_operation
+        for ladder in (HW_BOOST_LADDER, HW_OFF_LADDER):
+            if operation in ladder:
+                # The mode changes once fewer than threshold + 1 minutes are left
+                threshold = HW_OVERRIDE_MINUTES_THRESHOLDS[ladder.index(operation)]
+                when = self._last_operation_mode_timeout - (threshold + 1) * 60
+                self._unsub_relabel = async_track_point_in_utc_time(
+                    self.hass, self.__async_relabel, dt_util.utc_from_timestamp(when)
+                )
+                break
+
+    def __cancel_relabel(self) -> None:
+        if self._unsub_relabel is not None:
+            self._unsub_relabel()
+            self._unsub_relabel = None
+
+    @callback
+    def __async_relabel(self, _now) -> None:
+        self._unsub_relabel = None
+        self._handle_coordinator_update()
+
+    async def __send_hw_command(self, params: dict[str, Any]) -> bool:
+        """Send a cmd=3 command via the command queue, returning False if it was replaced."""
+        try:
+            return await self._command_queue.send(self.__send_command, {"cmd": 3} | params)
+        except (RuntimeError, asyncio.TimeoutError, aiohttp.ClientError):
+            # The command may or may not have been applied so fetch the current state
+            self.__request_refresh()
+            raise
+
+    async def __send_command(self, params: dict[str, Any]) -> None:
+        session = await self.coordinator.get_session()
+        await send_command(
+            session,
+            self._wunda_ip,
+            self._wunda_user,
+            self._wunda_pass,
+            timeout=self._timeout,
+            params=params)
+
+    def __request_refresh(self) -> None:
+        """Request a refresh from the coordinator without waiting for it to complete."""
+        self.hass.async_create_background_task(
+            self.coordinator.async_request_refresh(),
+            name=f"{DOMAIN}_refresh_{self._wunda_id}"
+        )
+
+    async def __async_update_hw_state(self, state: dict[str, str] | None) -> None:
+        """Update the coordinator data with the state expected after a command.
+
+        This avoids having to poll the hub switch after every command, and the
+        next scheduled update will pick up any differences. If the expected
+        state isn't known then a refresh is requested in the background instead.
+        """
+        if state is None:
+            self.__request_refresh()
+            return
+
+        data = self.coordinator.data
+        device = data[self._wunda_id]
+        self.coordinator.async_set_updated_data(data | {
+            self._wunda_id: device | {"state": device["state"] | state}
+        })
+
     async def async_set_operation_mode(self, operation_mode: str) -> None:
         duration = 0
+        params = state = None
         operation_mode = OPERATION_MODE_ALIASES.get(operation_mode, operation_mode)
         if operation_mode:
             if operation_mode in HW_OFF_OPERATIONS:
-                _, duration = _split_operation(operation_mode)
-                async with get_session(self._wunda_ip) as session:
-                    await send_command(
-                        session,
-                        self._wunda_ip,
-                        self._wunda_user,
-                        self._wunda_pass,
-                        timeout=self._timeout,
-                        params={
-                            "cmd": 3,
-                            "hw_off_time": duration
-                        })
+                duration = HW_OPERATION_DURATIONS[operation_mode]
+                params, state = {"hw_off_time": duration}, HW_OFF_STATE
             elif operation_mode in HW_BOOST_OPERATIONS:
-                _, duration = _split_operation(operation_mode)
-                async with get_session(self._wunda_ip) as session:
-                    await send_command(
-                        session,
-                        self._wunda_ip,
-                        self._wunda_user,
-                        self._wunda_pass,
-                        timeout=self._timeout,
-                        params={
-                            "cmd": 3,
-                            "hw_boost_time": duration
-                        })
+                duration = HW_OPERATION_DURATIONS[operation_mode]
+                params, state = {"hw_boost_time": duration}, HW_BOOST_STATE
             elif operation_mode == OPERATION_AUTO:
-                async with get_session(self._wunda_ip) as session:
-                    await send_command(
-                        session,
-                        self._wunda_ip,
-                        self._wunda_user,
-                        self._wunda_pass,
-                        timeout=self._timeout,
-                        params={
-                            "cmd": 3,
-                            "hw_boost_time": 0
-                        })
+                # Whether the hot water is on or off depends on the schedule,
+                # so the new state has to be fetched from the hub switch.
+                params = {"hw_boost_time": 0}
             else:
                 raise NotImplementedError(f"Unsupported operation mode {operation_mode}")
 
+        if params is not None and not await self.__send_hw_command(params):
+            # A later command replaced this one and will update the state
+            return
+
         # Remember the last operation mode that was set to use when getting the current operation mode.
         self._last_operation_mode = operation_mode
         self._last_operation_mode_timeout = time.time() + duration
 
-        # Fetch the updated state
-        await self.coordinator.async_request_refresh()
+        await self.__async_update_hw_state(state)
 
     async def async_set_boost(self, duration: timedelta):
-        seconds = int((duration.days * 24 * 3600) + math.ceil(duration.seconds))
+        state = None
+        seconds = duration.days * 24 * 3600 + duration.seconds
         if seconds > 0:
-            async with get_session(self._wunda_ip) as session:
-                await send_command(
-                    session,
-                    self._wunda_ip,
-                    self._wunda_user,
-                    self._wunda_pass,
-                    timeout=self._timeout,
-                    params={
-                        "cmd": 3,
-                        "hw_boost_time": seconds
-                    })
-
-        # Fetch the updated state
-        await self.coordinator.async_request_refresh()
+            if not await self.__send_hw_command({"hw_boost_time": seconds}):
+                return
+            state = HW_BOOST_STATE
+
+        await self.__async_update_hw_state(state)
 
     async def async_set_off(self, duration: timedelta):
-        seconds = int((duration.days * 24 * 3600) + math.ceil(duration.seconds))
+        state = None
+        seconds = duration.days * 24 * 3600 + duration.seconds
         if seconds > 0:
-            async with get_session(self._wunda_ip) as session:
-                await send_command(
-                    session,
-                    self._wunda_ip,
-                    self._wunda_user,
-                    self._wunda_pass,
-                    timeout=self._timeout,
-                    params={
-                        "cmd": 3,
-                        "hw_off_time": seconds
-                    })
-
-        # Fetch the updated state
-        await self.coordinator.async_request_refresh()
+            if not await self.__send_hw_command({"hw_off_time": seconds}):
+                return
+            state = HW_OFF_STATE
+
+        await self.__async_update_hw_state(state)
@@ -1,5 +1,12 @@
 """Fixtures for testing."""
+from pytest_homeassistant_custom_component.common import MockConfigEntry
 from homeassistant.const import CONF_HOST, CONF_USERNAME, CONF_PASSWORD
+from custom_components.wundasmart.const import DOMAIN
+from unittest.mock import patch
+from custom_components import wundasmart
+from custom_components.wundasmart import climate, water_heater
+from .utils import async_load_get_devices_fixture
+from types import MappingProxyType
 import pytest
 import sys
 
@@ -15,11 +22,53 @@ def auto_enable_custom_integrations(enable_custom_integrations):
     yield
 
 
-@pytest.fixture
-def config(enable_custom_integrations):
-    # pywundatest functions are mocked so no real host is needed
-    return {
+@pytest.fixture(scope="session")
+def config():
+    # pywundatest functions are mocked so no real host is needed.
+    # Shared between all tests, so make it read-only.
+    return MappingProxyType({
         CONF_HOST: "none",
         CONF_USERNAME: "root",
         CONF_PASSWORD: "password"
-    }
+    })
+
+
+@pytest.fixture
+def entry(hass, config):
+    """Add a config entry for the integration, without setting it up."""
+    entry = MockConfigEntry(domain=DOMAIN, data=config)
+    entry.add_to_hass(hass)
+    return entry
+
+
+@pytest.fixture
+def mock_get_devices():
+    """Patch get_devices for the duration of the test.
+
+    Set return_value (or side_effect) to the data the coordinator should fetch.
+    """
+    with patch.object(wundasmart, "get_devices") as mock:
+        yield mock
+
+
+@pytest.fixture
+def mock_send_command():
+    """Patch send_command for both the climate and water heater platforms."""
+    with patch.object(climate, "send_command", return_value=None) as mock, \
+            patch.object(water_heater, "send_command", new=mock):
+        yield mock
+
+
+@pytest.fixture
+async def setup_wundasmart(hass, entry, mock_get_devices, request):
+    """Set up the integration with get_devices returning the fixture named by request.param.
+
+    Use with pytest.mark.parametrize("setup_wundasmart", [...], indirect=True).
+    get_devices stays patched until the test completes, and the test can use
+    the mock_get_devices fixture to change the data before refreshing the coordinator.
+    """
+    mock_get_devices.return_value = await async_load_get_devices_fixture(hass, request.param)
+    await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    return entry, hass.data[DOMAIN][entry.entry_id]
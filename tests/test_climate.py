@@ -1,231 +1,207 @@
-from pytest_homeassistant_custom_component.common import MockConfigEntry
-from pytest_homeassistant_custom_component.common import load_fixture
-from custom_components.wundasmart.const import DOMAIN
+import asyncio
+import pytest
 from unittest.mock import patch
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from custom_components.wundasmart import climate
 from homeassistant.core import HomeAssistant
 from homeassistant.components.climate import HVACAction
-from .utils import deserialize_get_devices_fixture
+from .utils import async_load_get_devices_fixture
 
 
-async def test_climate(hass: HomeAssistant, config):
-    entry = MockConfigEntry(domain=DOMAIN, data=config)
-    entry.add_to_hass(hass)
+@pytest.mark.parametrize("setup_wundasmart", ["test_get_devices1.json"], indirect=True)
+async def test_climate(hass: HomeAssistant, setup_wundasmart, mock_get_devices):
+    _, coordinator = setup_wundasmart
 
     # Test setup of climate entity fetches initial state
-    data = deserialize_get_devices_fixture(load_fixture("test_get_devices1.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data):
-        await hass.config_entries.async_setup(entry.entry_id)
-        await hass.async_block_till_done()
-
-        state = hass.states.get("climate.test_room")
-
-        assert state
-        assert state.attributes["current_temperature"] == 17.8
-        assert state.attributes["current_humidity"] == 66.57
-        assert state.attributes["temperature"] == 0
-        assert state.state == "auto"
-        assert state.attributes["hvac_action"] == HVACAction.IDLE
+    state = hass.states.get("climate.test_room")
 
-    coordinator: DataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]
-    assert coordinator
+    assert state
+    attrs = state.attributes
+    assert attrs["current_temperature"] == 17.8
+    assert attrs["current_humidity"] == 66.57
+    assert attrs["temperature"] == 0
+    assert state.state == "auto"
+    assert attrs["hvac_action"] == HVACAction.IDLE
 
     # Test refreshing coordinator updates entity state
-    data = deserialize_get_devices_fixture(load_fixture("test_get_devices2.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data):
-        await coordinator.async_refresh()
-        await hass.async_block_till_done()
-
-        state = hass.states.get("climate.test_room")
+    mock_get_devices.return_value = await async_load_get_devices_fixture(hass, "test_get_devices2.json")
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
 
-        assert state
-        assert state.attributes["current_temperature"] == 16.0
-        assert state.attributes["temperature"] == 0
-        assert state.state == "auto"
-        assert state.attributes["hvac_action"] == HVACAction.PREHEATING
+    state = hass.states.get("climate.test_room")
 
+    assert state
+    attrs = state.attributes
+    assert attrs["current_temperature"] == 16.0
+    assert attrs["temperature"] == 0
+    assert state.state == "auto"
+    assert attrs["hvac_action"] == HVACAction.PREHEATING
 
-async def test_set_temperature(hass: HomeAssistant, config):
-    entry = MockConfigEntry(domain=DOMAIN, data=config)
-    entry.add_to_hass(hass)
 
+@pytest.mark.parametrize("setup_wundasmart", ["test_set_temperature.json"], indirect=True)
+async def test_set_temperature(hass: HomeAssistant, setup_wundasmart, mock_send_command):
     # Test setting temperature works
-    data = deserialize_get_devices_fixture(load_fixture("test_set_temperature.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data), \
-            patch("custom_components.wundasmart.climate.send_command", return_value=None) as mock:
-        await hass.config_entries.async_setup(entry.entry_id)
-        await hass.async_block_till_done()
-
-        # set the temperature
+    # set the temperature
+    await hass.services.async_call("climate", "set_temperature", {
+        "entity_id": "climate.test_room",
+        "temperature": 20
+    })
+    await hass.async_block_till_done()
+
+    # Check put_state was called for the right entity
+    assert mock_send_command.call_count == 1
+    assert mock_send_command.call_args.kwargs["params"]
+    assert mock_send_command.call_args.kwargs["params"]["roomid"] == 121
+
+    # Check the state was updated
+    state = hass.states.get("climate.test_room")
+    assert state
+    attrs = state.attributes
+    assert attrs["current_temperature"] == 16.0
+    assert attrs["temperature"] == 20
+    assert state.state == "heat"
+    assert attrs["hvac_action"] == HVACAction.IDLE
+
+
+@pytest.mark.parametrize("setup_wundasmart", ["test_set_temperature.json"], indirect=True)
+async def test_set_temperature_coalesced(hass: HomeAssistant, setup_wundasmart, mock_send_command):
+    release = asyncio.Event()
+
+    async def send_command(*args, **kwargs):
+        await release.wait()
+
+    mock_send_command.side_effect = send_command
+
+    # Set the temperature several times without waiting for the commands to be sent
+    for temperature in (18, 19, 20):
         await hass.services.async_call("climate", "set_temperature", {
             "entity_id": "climate.test_room",
-            "temperature": 20
+            "temperature": temperature
         })
-        await hass.async_block_till_done()
-
-        # Check put_state was called for the right entity
-        assert mock.call_count == 1
-        assert mock.call_args.kwargs["params"]
-        assert mock.call_args.kwargs["params"]["roomid"] == 121
+        await asyncio.sleep(0)
 
-        # Check the state was updated
-        state = hass.states.get("climate.test_room")
-        assert state
-        assert state.attributes["current_temperature"] == 16.0
-        assert state.attributes["temperature"] == 20
-        assert state.state == "heat"
-        assert state.attributes["hvac_action"] == HVACAction.IDLE
+    release.set()
+    await hass.async_block_till_done()
 
+    # The second command was replaced by the third before it was sent
+    assert mock_send_command.call_count == 2
+    assert [c.kwargs["params"]["temp"] for c in mock_send_command.call_args_list] == [18, 20]
+    assert all(c.kwargs["params"]["roomid"] == 121 for c in mock_send_command.call_args_list)
 
-async def test_trvs_only(hass: HomeAssistant, config):
-    entry = MockConfigEntry(domain=DOMAIN, data=config)
-    entry.add_to_hass(hass)
 
+@pytest.mark.parametrize("setup_wundasmart", ["test_trvs_only.json"], indirect=True)
+async def test_trvs_only(hass: HomeAssistant, setup_wundasmart):
     # Rooms with TRVs only and no sensor should still get a temperature reading
-    data = deserialize_get_devices_fixture(load_fixture("test_trvs_only.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data):
-        await hass.config_entries.async_setup(entry.entry_id)
-        await hass.async_block_till_done()
-
-        state = hass.states.get("climate.test_room")
-
-        assert state
-        assert state.attributes["current_temperature"] == 15.5
-        assert "current_humidity" not in state.attributes
-
-
-async def test_hvac_mode_when_manually_turned_off(hass: HomeAssistant, config):
-    entry = MockConfigEntry(domain=DOMAIN, data=config)
-    entry.add_to_hass(hass)
-
-    data = deserialize_get_devices_fixture(load_fixture("test_manual_off.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data):
-        await hass.config_entries.async_setup(entry.entry_id)
-        await hass.async_block_till_done()
-
-        state = hass.states.get("climate.test_room")
-
-        assert state
-        assert state.state == HVACAction.OFF
-        assert state.attributes["hvac_action"] == HVACAction.OFF
-
-
-async def test_set_presets(hass: HomeAssistant, config):
-    entry = MockConfigEntry(domain=DOMAIN, data=config)
-    entry.add_to_hass(hass)
-
-    data = deserialize_get_devices_fixture(load_fixture("test_set_presets.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data), \
-            patch("custom_components.wundasmart.climate.send_command", return_value=None) as mock:
-        await hass.config_entries.async_setup(entry.entry_id)
-        await hass.async_block_till_done()
-
-        state = hass.states.get("climate.test_room")
-
-        assert state
-        assert state.attributes["temperature"] == 21.0
-        assert state.attributes["preset_mode"] == "comfort"
-
-        # set the preset 'reduced'
-        await hass.services.async_call("climate", "set_preset_mode", {
+    state = hass.states.get("climate.test_room")
+
+    assert state
+    attrs = state.attributes
+    assert attrs["current_temperature"] == 15.5
+    assert "current_humidity" not in attrs
+
+
+@pytest.mark.parametrize("setup_wundasmart", ["test_manual_off.json"], indirect=True)
+async def test_hvac_mode_when_manually_turned_off(hass: HomeAssistant, setup_wundasmart):
+    state = hass.states.get("climate.test_room")
+
+    assert state
+    assert state.state == HVACAction.OFF
+    assert state.attributes["hvac_action"] == HVACAction.OFF
+
+
+@pytest.mark.parametrize("setup_wundasmart", ["test_set_presets.json"], indirect=True)
+async def test_set_presets(hass: HomeAssistant, setup_wundasmart, mock_send_command):
+    state = hass.states.get("climate.test_room")
+
+    assert state
+    attrs = state.attributes
+    assert attrs["temperature"] == 21.0
+    assert attrs["preset_mode"] == "comfort"
+
+    # set the preset 'reduced'
+    await hass.services.async_call("climate", "set_preset_mode", {
+        "entity_id": "climate.test_room",
+        "preset_mode": "reduced"
+    })
+    await hass.async_block_till_done()
+
+    # Check send_command was called correctly
+    assert mock_send_command.call_count == 1
+    assert mock_send_command.call_args.kwargs["params"]
+    assert mock_send_command.call_args.kwargs["params"]["roomid"] == 121
+    assert mock_send_command.call_args.kwargs["params"]["temp"] == 14.0
+
+    # set the preset 'eco'
+    await hass.services.async_call("climate", "set_preset_mode", {
+        "entity_id": "climate.test_room",
+        "preset_mode": "eco"
+    })
+    await hass.async_block_till_done()
+
+    # Check send_command was called correctly
+    assert mock_send_command.call_count == 2
+    assert mock_send_command.call_args.kwargs["params"]
+    assert mock_send_command.call_args.kwargs["params"]["roomid"] == 121
+    assert mock_send_command.call_args.kwargs["params"]["temp"] == 19.0
+
+    # set the preset 'comfort'
+    await hass.services.async_call("climate", "set_preset_mode", {
+        "entity_id": "climate.test_room",
+        "preset_mode": "comfort"
+    })
+    await hass.async_block_till_done()
+
+    # Check send_command was called correctly
+    assert mock_send_command.call_count == 3
+    assert mock_send_command.call_args.kwargs["params"]
+    assert mock_send_command.call_args.kwargs["params"]["roomid"] == 121
+    assert mock_send_command.call_args.kwargs["params"]["temp"] == 21.0
+
+
+@pytest.mark.parametrize("setup_wundasmart", ["test_set_presets.json"], indirect=True)
+async def test_set_preset_temps(hass: HomeAssistant, setup_wundasmart, mock_send_command):
+    with patch.object(climate, "set_register", return_value=None) as mock:
+        await hass.services.async_call("wundasmart", "set_preset_temperature", {
             "entity_id": "climate.test_room",
-            "preset_mode": "reduced"
+            "preset": "eco",
+            "temperature": 10
         })
         await hass.async_block_till_done()
 
         # Check send_command was called correctly
         assert mock.call_count == 1
-        assert mock.call_args.kwargs["params"]
-        assert mock.call_args.kwargs["params"]["roomid"] == 121
-        assert mock.call_args.kwargs["params"]["temp"] == 14.0
-
-        # set the preset 'eco'
-        await hass.services.async_call("climate", "set_preset_mode", {
-            "entity_id": "climate.test_room",
-            "preset_mode": "eco"
-        })
-        await hass.async_block_till_done()
-
-        # Check send_command was called correctly
-        assert mock.call_count == 2
-        assert mock.call_args.kwargs["params"]
-        assert mock.call_args.kwargs["params"]["roomid"] == 121
-        assert mock.call_args.kwargs["params"]["temp"] == 19.0
-
-        # set the preset 'comfort'
-        await hass.services.async_call("climate", "set_preset_mode", {
-            "entity_id": "climate.test_room",
-            "preset_mode": "comfort"
-        })
-        await hass.async_block_till_done()
-
-        # Check send_command was called correctly
-        assert mock.call_count == 3
-        assert mock.call_args.kwargs["params"]
-        assert mock.call_args.kwargs["params"]["roomid"] == 121
-        assert mock.call_args.kwargs["params"]["temp"] == 21.0
-
-
-async def test_set_preset_temps(hass: HomeAssistant, config):
-    entry = MockConfigEntry(domain=DOMAIN, data=config)
-    entry.add_to_hass(hass)
-
-    data = deserialize_get_devices_fixture(load_fixture("test_set_presets.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data), \
-            patch("custom_components.wundasmart.climate.send_command", return_value=None) as mock:
-        await hass.config_entries.async_setup(entry.entry_id)
-        await hass.async_block_till_done()
-
-        with patch("custom_components.wundasmart.climate.set_register", return_value=None) as mock:
-            await hass.services.async_call("wundasmart", "set_preset_temperature", {
-                "entity_id": "climate.test_room",
-                "preset": "eco",
-                "temperature": 10
-            })
-            await hass.async_block_till_done()
-
-            # Check send_command was called correctly
-            assert mock.call_count == 1
-            assert mock.call_args.kwargs["device_id"] == 121
-            assert mock.call_args.kwargs["register_id"] == "t_norm"
-            assert mock.call_args.kwargs["value"] == 10
-
-async def test_turn_on_off(hass: HomeAssistant, config):
-    entry = MockConfigEntry(domain=DOMAIN, data=config)
-    entry.add_to_hass(hass)
-
-    data = deserialize_get_devices_fixture(load_fixture("test_manual_off.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data):
-        await hass.config_entries.async_setup(entry.entry_id)
-        await hass.async_block_till_done()
-
-        state = hass.states.get("climate.test_room")
-
-        assert state
-        assert state.state == HVACAction.OFF
-        assert state.attributes["hvac_action"] == HVACAction.OFF
-        temp = state.attributes["temperature"]
-
-        with patch("custom_components.wundasmart.climate.send_command", return_value=None) as mock:
-            await hass.services.async_call("climate", "turn_on", {
-                "entity_id": "climate.test_room"
-            })
-            await hass.async_block_till_done()
-
-            # Check send_command was called correctly
-            assert mock.call_count == 1
-            assert mock.call_args.kwargs["params"]
-            assert mock.call_args.kwargs["params"]["roomid"] == 121
-            assert mock.call_args.kwargs["params"]["temp"] == 21
-
-        with patch("custom_components.wundasmart.climate.send_command", return_value=None) as mock:
-            await hass.services.async_call("climate", "turn_off", {
-                "entity_id": "climate.test_room"
-            })
-            await hass.async_block_till_done()
-
-            # Check send_command was called correctly
-            assert mock.call_count == 1
-            assert mock.call_args.kwargs["params"]
-            assert mock.call_args.kwargs["params"]["roomid"] == 121
-            assert mock.call_args.kwargs["params"]["temp"] == 0
+        assert mock.call_args.kwargs["device_id"] == 121
+        assert mock.call_args.kwargs["register_id"] == "t_norm"
+        assert mock.call_args.kwargs["value"] == 10
+
+@pytest.mark.parametrize("setup_wundasmart", ["test_manual_off.json"], indirect=True)
+async def test_turn_on_off(hass: HomeAssistant, setup_wundasmart, mock_send_command):
+    state = hass.states.get("climate.test_room")
+
+    assert state
+    attrs = state.attributes
+    assert state.state == HVACAction.OFF
+    assert attrs["hvac_action"] == HVACAction.OFF
+    temp = attrs["temperature"]
+
+    await hass.services.async_call("climate", "turn_on", {
+        "entity_id": "climate.test_room"
+    })
+    await hass.async_block_till_done()
+
+    # Check send_command was called correctly
+    assert mock_send_command.call_count == 1
+    assert mock_send_command.call_args.kwargs["params"]
+    assert mock_send_command.call_args.kwargs["params"]["roomid"] == 121
+    assert mock_send_command.call_args.kwargs["params"]["temp"] == 21
+
+    mock_send_command.reset_mock()
+    await hass.services.async_call("climate", "turn_off", {
+        "entity_id": "climate.test_room"
+    })
+    await hass.async_block_till_done()
+
+    # Check send_command was called correctly
+    assert mock_send_command.call_count == 1
+    assert mock_send_command.call_args.kwargs["params"]
+    assert mock_send_command.call_args.kwargs["params"]["roomid"] == 121
+    assert mock_send_command.call_args.kwargs["params"]["temp"] == 0
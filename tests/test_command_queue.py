@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from custom_components.wundasmart.pywundasmart import CommandQueue
+
+
+async def test_command_queue():
+    queue = CommandQueue()
+    release = asyncio.Event()
+    sent = []
+
+    async def send(params):
+        await release.wait()
+        sent.append(params)
+
+    # The first command is sent straight away
+    first = asyncio.create_task(queue.send(send, {"temp": 18}))
+    await asyncio.sleep(0)
+
+    # and commands made while it's being sent are queued
+    second = asyncio.create_task(queue.send(send, {"temp": 19}))
+    third = asyncio.create_task(queue.send(send, {"temp": 20}))
+    await asyncio.sleep(0)
+
+    release.set()
+    assert await first is True
+    assert await second is False  # replaced by the third command
+    assert await third is True
+
+    # Only the first and latest commands are sent
+    assert sent == [{"temp": 18}, {"temp": 20}]
+
+
+async def test_command_queue_replacing_command_fails():
+    queue = CommandQueue()
+    release = asyncio.Event()
+    sent = []
+    failed = []
+
+    async def send(params):
+        await release.wait()
+        # Fail the first attempt to send the replacing command
+        if params == {"temp": 20} and not failed:
+            failed.append(params)
+            raise RuntimeError("send failed")
+        sent.append(params)
+
+    first = asyncio.create_task(queue.send(send, {"temp": 18}))
+    await asyncio.sleep(0)
+
+    second = asyncio.create_task(queue.send(send, {"temp": 19}))
+    third = asyncio.create_task(queue.send(send, {"temp": 20}))
+    await asyncio.sleep(0)
+
+    release.set()
+    assert await first is True
+
+    # The second caller sends the third command in its place, so gets the error
+    with pytest.raises(RuntimeError):
+        await second
+
+    # and the third caller sends its own command again
+    assert await third is True
+    assert failed == [{"temp": 20}]
+    assert sent == [{"temp": 18}, {"temp": 20}]
+
+    # Nothing is left waiting to be sent
+    assert queue._pending is None
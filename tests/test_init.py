@@ -1,8 +1,49 @@
 """Test component setup."""
+import pytest
 from homeassistant.setup import async_setup_component
+from homeassistant.core import HomeAssistant
 from custom_components.wundasmart.const import DOMAIN
+from .utils import async_load_get_devices_fixture
 
 
 async def test_async_setup(hass, config):
     """Test the component gets setup."""
     assert await async_setup_component(hass, DOMAIN, config) is True
+
+
+@pytest.mark.parametrize("setup_wundasmart", ["test_get_devices1.json"], indirect=True)
+async def test_shared_session(hass: HomeAssistant, setup_wundasmart):
+    entry, coordinator = setup_wundasmart
+
+    # The same session is used for all requests to the hub switch
+    session = await coordinator.get_session()
+    assert await coordinator.get_session() is session
+
+    # and is closed when the entry is unloaded
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    assert session.closed
+
+
+@pytest.mark.parametrize("setup_wundasmart", ["test_get_devices1.json"], indirect=True)
+async def test_unchanged_data_not_notified(hass: HomeAssistant, setup_wundasmart, mock_get_devices):
+    _, coordinator = setup_wundasmart
+    prev_data = coordinator.data
+
+    calls = []
+    unsub = coordinator.async_add_listener(lambda: calls.append(coordinator.data))
+
+    # Listeners aren't called if nothing has changed
+    mock_get_devices.return_value = await async_load_get_devices_fixture(hass, "test_get_devices1.json")
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+
+    assert not calls
+    assert coordinator.data is prev_data
+
+    # but are when it has
+    mock_get_devices.return_value = await async_load_get_devices_fixture(hass, "test_get_devices2.json")
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+
+    assert len(calls) == 1
+    unsub()
@@ -0,0 +1,109 @@
+from custom_components.wundasmart import pywundasmart
+from custom_components.wundasmart.pywundasmart import (
+    get_room_id_from_device,
+    send_command,
+    _get_retry_delay,
+    _is_retryable,
+)
+from unittest.mock import AsyncMock, patch
+import pytest
+
+
+@pytest.mark.parametrize("state", [None, {}, {"room_id": None}])
+def test_trv_without_room_id(state):
+    device = {"device_type": "TRV", "device_id": 31, "hw_version": 4.0}
+    if state is not None:
+        device["state"] = state
+
+    # TRVs that aren't assigned to a room have no room id
+    assert get_room_id_from_device(device) is None
+
+
+def test_trv_room_id():
+    device = {"device_type": "TRV", "device_id": 31, "hw_version": 4.0, "state": {"room_id": "0"}}
+    assert get_room_id_from_device(device) == 121
+
+
+class MockResponse:
+    def __init__(self, status, body=b"{}"):
+        self.status = status
+        self._body = body
+
+    async def read(self):
+        return self._body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class MockSession:
+    """Returns a response with each of the given statuses in turn."""
+
+    def __init__(self, *statuses):
+        self._statuses = iter(statuses)
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        return MockResponse(next(self._statuses))
+
+
+@pytest.mark.parametrize("status, expected", [
+    (200, True),
+    (400, False),
+    (401, False),
+    (404, False),
+    (429, True),
+    (500, True),
+    (503, True),
+    ("error", True),  # setregister.cgi error statuses
+    (None, True),
+])
+def test_is_retryable(status, expected):
+    assert _is_retryable(status) is expected
+
+
+def test_retry_delay_doubles():
+    with patch.object(pywundasmart.random, "uniform", return_value=1.0):
+        assert [_get_retry_delay(0.5, attempts) for attempts in (1, 2, 3, 4)] == [0.5, 1.0, 2.0, 4.0]
+
+    # Jitter only ever shortens the delay, by up to half
+    for attempts in (1, 2, 3, 4):
+        assert 0.5 * 2 ** (attempts - 2) <= _get_retry_delay(0.5, attempts) <= 0.5 * 2 ** (attempts - 1)
+
+
+@pytest.mark.parametrize("status", [401, 404])
+async def test_send_command_client_error_not_retried(status):
+    session = MockSession(status, 200)
+    with patch.object(pywundasmart.asyncio, "sleep", new=AsyncMock()) as sleep:
+        with pytest.raises(RuntimeError):
+            await send_command(session, "none", "root", "password", params={"cmd": 1})
+
+    assert session.calls == 1
+    assert sleep.call_count == 0
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+async def test_send_command_retried(status):
+    session = MockSession(status, status, 200)
+    with patch.object(pywundasmart.asyncio, "sleep", new=AsyncMock()) as sleep:
+        assert await send_command(session, "none", "root", "password", params={"cmd": 1}) == {}
+
+    assert session.calls == 3
+    assert sleep.call_count == 2
+
+
+async def test_send_command_gives_up_after_retries():
+    session = MockSession(*[500] * 5)
+    with patch.object(pywundasmart.asyncio, "sleep", new=AsyncMock()) as sleep:
+        with pytest.raises(RuntimeError):
+            await send_command(session, "none", "root", "password", params={"cmd": 1}, retries=5)
+
+    assert session.calls == 5
+    # No sleep after the last attempt, and the delays never get shorter
+    delays = [c.args[0] for c in sleep.call_args_list]
+    assert len(delays) == 4
+    assert all(a <= b for a, b in zip(delays, delays[1:]))
@@ -1,39 +1,26 @@
 from pytest_homeassistant_custom_component.common import load_fixture
 from custom_components.wundasmart.pywundasmart import parse_syncvalues
+from collections import Counter
+import pytest
 
 
-async def test_parse_syncvalues_v2():
-    data = load_fixture("syncvalues_v2.txt")
-    devices = parse_syncvalues(data)
-    assert devices
-
-    sensors = [d for d in devices.values() if d["device_type"] == "SENSOR"]
-    assert len(sensors) == 10
-
-    trvs = [d for d in devices.values() if d["device_type"] == "TRV"]
-    assert len(trvs) == 0
-
-    ufh = [d for d in devices.values() if d["device_type"] == "UFH"]
-    assert len(ufh) == 4
+# Expected number of devices of each type in each syncvalues fixture
+EXPECTED_DEVICE_COUNTS = {
+    "syncvalues_v2.txt": {"SENSOR": 10, "TRV": 0, "UFH": 4, "ROOM": 11},
+    "syncvalues_v4.txt": {"SENSOR": 9, "TRV": 5, "UFH": 1, "ROOM": 9},
+}
 
-    rooms = [d for d in devices.values() if d["device_type"] == "ROOM"]
-    assert len(rooms) == 11
 
+@pytest.fixture(scope="module", params=list(EXPECTED_DEVICE_COUNTS))
+def parsed_syncvalues(request):
+    """Parse each syncvalues fixture once for all the tests in this module."""
+    return request.param, parse_syncvalues(load_fixture(request.param))
 
 
-async def test_parse_syncvalues_v4():
-    data = load_fixture("syncvalues_v4.txt")
-    devices = parse_syncvalues(data)
+def test_parse_syncvalues(parsed_syncvalues):
+    filename, devices = parsed_syncvalues
     assert devices
 
-    sensors = [d for d in devices.values() if d["device_type"] == "SENSOR"]
-    assert len(sensors) == 9
-
-    trvs = [d for d in devices.values() if d["device_type"] == "TRV"]
-    assert len(trvs) == 5
-
-    ufh = [d for d in devices.values() if d["device_type"] == "UFH"]
-    assert len(ufh) == 1
-
-    rooms = [d for d in devices.values() if d["device_type"] == "ROOM"]
-    assert len(rooms) == 9
+    counts = Counter(d["device_type"] for d in devices.values())
+    for device_type, expected in EXPECTED_DEVICE_COUNTS[filename].items():
+        assert counts[device_type] == expected, device_type
@@ -1,110 +1,121 @@
-from pytest_homeassistant_custom_component.common import MockConfigEntry
-from pytest_homeassistant_custom_component.common import load_fixture
-from custom_components.wundasmart.const import DOMAIN
+import pytest
+from datetime import timedelta
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
 from custom_components.wundasmart.water_heater import STATE_ON, STATE_OFF
-from unittest.mock import patch
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 from homeassistant.core import HomeAssistant
-from .utils import deserialize_get_devices_fixture
+from .utils import async_load_get_devices_fixture
 
-import json
 
-
-async def test_water_header(hass: HomeAssistant, config):
-    entry = MockConfigEntry(domain=DOMAIN, data=config)
-    entry.add_to_hass(hass)
+@pytest.mark.parametrize("setup_wundasmart", ["test_get_devices1.json"], indirect=True)
+async def test_water_header(hass: HomeAssistant, setup_wundasmart, mock_get_devices):
+    _, coordinator = setup_wundasmart
 
     # Test setup of water heater entity fetches initial state
-    data = deserialize_get_devices_fixture(load_fixture("test_get_devices1.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data):
-        await hass.config_entries.async_setup(entry.entry_id)
-        await hass.async_block_till_done()
-
-        state = hass.states.get("water_heater.smart_hubswitch")
-
-        assert state
-        assert state.state == STATE_ON
-
-    coordinator: DataUpdateCoordinator = hass.data[DOMAIN][entry.entry_id]
-    assert coordinator
+    state = hass.states.get("water_heater.smart_hubswitch")
 
-    data = deserialize_get_devices_fixture(load_fixture("test_get_devices2.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data):
-        await coordinator.async_refresh()
-        await hass.async_block_till_done()
+    assert state
+    assert state.state == STATE_ON
 
-        state = hass.states.get("water_heater.smart_hubswitch")
+    mock_get_devices.return_value = await async_load_get_devices_fixture(hass, "test_get_devices2.json")
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
 
-        assert state
-        assert state.state == STATE_ON
+    state = hass.states.get("water_heater.smart_hubswitch")
 
-    data = deserialize_get_devices_fixture(load_fixture("test_get_devices3.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data):
-        await coordinator.async_refresh()
-        await hass.async_block_till_done()
+    assert state
+    assert state.state == STATE_ON
 
-        state = hass.states.get("water_heater.smart_hubswitch")
+    mock_get_devices.return_value = await async_load_get_devices_fixture(hass, "test_get_devices3.json")
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
 
-        assert state
-        assert state.state == STATE_OFF
+    state = hass.states.get("water_heater.smart_hubswitch")
 
+    assert state
+    assert state.state == STATE_OFF
 
-async def test_water_header_set_operation(hass: HomeAssistant, config):
-    entry = MockConfigEntry(domain=DOMAIN, data=config)
-    entry.add_to_hass(hass)
 
-    data = deserialize_get_devices_fixture(load_fixture("test_get_devices1.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data), \
-            patch("custom_components.wundasmart.water_heater.send_command", return_value=None) as mock:
-        await hass.config_entries.async_setup(entry.entry_id)
-        await hass.async_block_till_done()
+@pytest.mark.parametrize("setup_wundasmart", ["test_get_devices1.json"], indirect=True)
+async def test_water_header_set_operation(hass: HomeAssistant, setup_wundasmart, mock_send_command):
+    state = hass.states.get("water_heater.smart_hubswitch")
+    assert state
 
-        state = hass.states.get("water_heater.smart_hubswitch")
-        assert state
+    await hass.services.async_call("water_heater", "set_operation_mode", {
+        "entity_id": "water_heater.smart_hubswitch",
+        "operation_mode": "boost_30"
+    })
+    await hass.async_block_till_done()
 
-        await hass.services.async_call("water_heater", "set_operation_mode", {
-            "entity_id": "water_heater.smart_hubswitch",
-            "operation_mode": "boost_30"
-        })
-        await hass.async_block_till_done()
+    # Check send_command was called correctly
+    assert mock_send_command.call_count == 1
+    assert mock_send_command.call_args.kwargs["params"]["cmd"] == 3
+    assert mock_send_command.call_args.kwargs["params"]["hw_boost_time"] == 1800
 
-        # Check send_command was called correctly
-        assert mock.call_count == 1
-        assert mock.call_args.kwargs["params"]["cmd"] == 3
-        assert mock.call_args.kwargs["params"]["hw_boost_time"] == 1800
+    # Check the state was updated without waiting for the hub switch to be polled
+    state = hass.states.get("water_heater.smart_hubswitch")
+    assert state
+    assert state.state == "boost_30"
 
-        await hass.services.async_call("water_heater", "set_operation_mode", {
-            "entity_id": "water_heater.smart_hubswitch",
-            "operation_mode": "off_60"
-        })
-        await hass.async_block_till_done()
+    await hass.services.async_call("water_heater", "set_operation_mode", {
+        "entity_id": "water_heater.smart_hubswitch",
+        "operation_mode": "off_60"
+    })
+    await hass.async_block_till_done()
 
-        assert mock.call_count == 2
-        assert mock.call_args.kwargs["params"]["cmd"] == 3
-        assert mock.call_args.kwargs["params"]["hw_off_time"] == 3600
+    assert mock_send_command.call_count == 2
+    assert mock_send_command.call_args.kwargs["params"]["cmd"] == 3
+    assert mock_send_command.call_args.kwargs["params"]["hw_off_time"] == 3600
 
+    state = hass.states.get("water_heater.smart_hubswitch")
+    assert state
+    assert state.state == "off_60"
 
-async def test_water_header_boost(hass: HomeAssistant, config):
-    entry = MockConfigEntry(domain=DOMAIN, data=config)
-    entry.add_to_hass(hass)
 
+@pytest.mark.parametrize("setup_wundasmart", ["test_get_devices1.json"], indirect=True)
+async def test_water_header_boost(hass: HomeAssistant, setup_wundasmart, mock_send_command):
     # Test setup of water heater entity fetches initial state
-    data = deserialize_get_devices_fixture(load_fixture("test_get_devices1.json"))
-    with patch("custom_components.wundasmart.get_devices", return_value=data), \
-            patch("custom_components.wundasmart.water_heater.send_command", return_value=None) as mock:
-        await hass.config_entries.async_setup(entry.entry_id)
-        await hass.async_block_till_done()
-
-        state = hass.states.get("water_heater.smart_hubswitch")
-        assert state
-
-        await hass.services.async_call("wundasmart", "hw_boost", {
-            "entity_id": "water_heater.smart_hubswitch",
-            "duration": "00:10:00"
-        })
-        await hass.async_block_till_done()
-
-        # Check send_command was called correctly
-        assert mock.call_count == 1
-        assert mock.call_args.kwargs["params"]["cmd"] == 3
-        assert mock.call_args.kwargs["params"]["hw_boost_time"] == 600
+    state = hass.states.get("water_heater.smart_hubswitch")
+    assert state
+
+    await hass.services.async_call("wundasmart", "hw_boost", {
+        "entity_id": "water_heater.smart_hubswitch",
+        "duration": "00:10:00"
+    })
+    await hass.async_block_till_done()
+
+    # Check send_command was called correctly
+    assert mock_send_command.call_count == 1
+    assert mock_send_command.call_args.kwargs["params"]["cmd"] == 3
+    assert mock_send_command.call_args.kwargs["params"]["hw_boost_time"] == 600
+
+
+@pytest.mark.parametrize("setup_wundasmart", ["test_get_devices1.json"], indirect=True)
+async def test_water_header_off_runs_down(hass: HomeAssistant, setup_wundasmart, mock_get_devices,
+                                          mock_send_command, freezer):
+    _, coordinator = setup_wundasmart
+
+    await hass.services.async_call("water_heater", "set_operation_mode", {
+        "entity_id": "water_heater.smart_hubswitch",
+        "operation_mode": "off_60"
+    })
+    await hass.async_block_till_done()
+    assert hass.states.get("water_heater.smart_hubswitch").state == "off_60"
+
+    # The hub switch keeps reporting the same state while the hot water is off
+    mock_get_devices.return_value = {"state": True, "devices": dict(coordinator.data)}
+
+    # The mode runs down with the time left, without the hub switch data changing
+    freezer.tick(timedelta(minutes=29))
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert hass.states.get("water_heater.smart_hubswitch").state == "off_60"
+
+    freezer.tick(timedelta(minutes=2))
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert hass.states.get("water_heater.smart_hubswitch").state == "off_30"
+
+    freezer.tick(timedelta(minutes=29))
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert hass.states.get("water_heater.smart_hubswitch").state == STATE_OFF
@@ -1,14 +1,33 @@
-from pytest_homeassistant_custom_component.common import load_json_value_fixture
-import json
+from pytest_homeassistant_custom_component.common import load_fixture
+import functools
+import orjson
 
 def deserialize_get_devices_fixture(data):
-    data = json.loads(data)
+    data = orjson.loads(data)
     devices = data.get("devices")
     if devices:
-        data["devices"] = {int(k): v for k, v in devices.items()}
-
-    for device_id, device in devices.items():
-        device.setdefault("device_id", int(device_id))
-        device.setdefault("hw_version", 4.0)
+        # Re-key the devices by int id and fill in the defaults in one pass
+        devices_by_id = {}
+        for k, device in devices.items():
+            device_id = int(k)
+            device.setdefault("device_id", device_id)
+            device.setdefault("hw_version", 4.0)
+            devices_by_id[device_id] = device
+        data["devices"] = devices_by_id
 
     return data
+
+
+@functools.lru_cache(maxsize=None)
+def _load_fixture(filename):
+    return load_fixture(filename)
+
+
+async def async_load_get_devices_fixture(hass, filename):
+    """Load a get_devices fixture without blocking the event loop.
+
+    The file is only read once, but is parsed on every call so that tests
+    can't change the data seen by other tests.
+    """
+    data = await hass.async_add_executor_job(_load_fixture, filename)
+    return deserialize_get_devices_fixture(data)